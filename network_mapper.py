@@ -9,7 +9,7 @@ import json
 import logging
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
 
@@ -34,7 +34,16 @@ logger = logging.getLogger(__name__)
 
 console = Console()
 
-@dataclass
+# Number of finished devices per progress bar update
+_PROGRESS_BATCH = 32
+
+# Ports probed for every device in discovery mode
+_DISCOVERY_PORTS: Tuple[int, ...] = (21, 22, 23, 25, 53, 80, 110, 143, 443, 993, 995, 3306, 3389, 5432, 8080)
+
+# Slotted dataclasses need Python 3.10+; older interpreters keep a per-instance __dict__
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class ScanResult:
     """Represents a single device scan result"""
     ip_address: str
@@ -57,6 +66,29 @@ class ScanResult:
             self.services = {}
         if self.protocols is None:
             self.protocols = []
+    
+    def as_row(self, mode: str) -> Tuple[str, ...]:
+        """Console table row for this result"""
+        
+        row = (
+            self.ip_address,
+            self.mac_address or "Unknown",
+            self.manufacturer or "Unknown",
+            self.device_type or "Unknown"
+        )
+        
+        if mode == "local":
+            row += (
+                self.operating_system or "Unknown",
+                ", ".join(map(str, self.open_ports)) or "None",
+                ", ".join(self.protocols) or "None"
+            )
+        
+        return row
+
+async def _none() -> None:
+    """Awaitable placeholder for a skipped lookup"""
+    return None
 
 class NetworkMapper:
     """Main network mapping application"""
@@ -76,6 +108,8 @@ class NetworkMapper:
         
         # Initialize scan components
         scan_results = []
+        self.scanner.clear_scan_cache()
+        self.device_classifier.clear_scan_cache()
         
         with Progress(
             SpinnerColumn(),
@@ -90,18 +124,44 @@ class NetworkMapper:
             
             # Phase 2: Detailed analysis based on mode
             if mode == "local" and detailed:
+                # Scan ports and services for all devices with a single nmap run
+                prefetch = progress.add_task("Scanning ports and services...", total=1)
+                await self.device_classifier.prefetch_ports_and_services([d['ip'] for d in devices])
+                progress.update(prefetch, completed=1)
+                
                 task = progress.add_task("Performing detailed local analysis...", total=len(devices))
-                for device in devices:
-                    result = await self._detailed_local_scan(device)
-                    scan_results.append(result)
-                    progress.advance(task)
+                scan_device = self._detailed_local_scan
             else:
                 task = progress.add_task("Performing network discovery...", total=len(devices))
-                for device in devices:
-                    result = await self._discovery_scan(device)
-                    scan_results.append(result)
-                    progress.advance(task)
-        
+                scan_device = self._discovery_scan
+
+            # Scan devices concurrently, bounded by max_concurrent_scans
+            semaphore = asyncio.Semaphore(self.config.max_concurrent_scans)
+            pending_advance = 0
+
+            async def _scan_one(device):
+                nonlocal pending_advance
+                try:
+                    async with semaphore:
+                        return await scan_device(device)
+                finally:
+                    # Re-render the progress bar once per batch rather than per device
+                    pending_advance += 1
+                    if pending_advance >= _PROGRESS_BATCH:
+                        progress.update(task, advance=pending_advance)
+                        pending_advance = 0
+
+            tasks = [asyncio.create_task(_scan_one(device)) for device in devices]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            if pending_advance:
+                progress.update(task, advance=pending_advance)
+
+            for device, result in zip(devices, results):
+                if isinstance(result, Exception):
+                    console.print(f"[yellow]Warning: Scan failed for {device['ip']}: {result}[/yellow]")
+                    continue
+                scan_results.append(result)
+
         return scan_results
     
     async def _detailed_local_scan(self, device: Dict[str, Any]) -> ScanResult:
@@ -145,28 +205,33 @@ class NetworkMapper:
             scan_mode="discovery"
         )
         
+        # MAC lookup, quick classification and basic port scan are independent, so overlap them
+        manufacturer, device_type, open_ports = await asyncio.gather(
+            self.mac_lookup.get_manufacturer(result.mac_address) if result.mac_address else _none(),
+            self.device_classifier.quick_classify(device),
+            self.scanner.quick_port_scan(device['ip'], _DISCOVERY_PORTS),
+            return_exceptions=True
+        )
+        
         # Basic MAC analysis
-        if result.mac_address:
-            try:
-                result.manufacturer = await self.mac_lookup.get_manufacturer(result.mac_address)
-            except Exception as e:
-                console.print(f"[yellow]Warning: MAC lookup failed for {result.mac_address}: {e}[/yellow]")
+        if isinstance(manufacturer, Exception):
+            console.print(f"[yellow]Warning: MAC lookup failed for {result.mac_address}: {manufacturer}[/yellow]")
+        else:
+            result.manufacturer = manufacturer
         
         # Quick device classification
-        try:
-            result.device_type = await self.device_classifier.quick_classify(device)
-        except Exception as e:
-            console.print(f"[yellow]Warning: Device classification failed for {device['ip']}: {e}[/yellow]")
+        if isinstance(device_type, Exception):
+            console.print(f"[yellow]Warning: Device classification failed for {device['ip']}: {device_type}[/yellow]")
             result.device_type = "unknown"
+        else:
+            result.device_type = device_type
         
         # Basic port scan
-        try:
-            common_ports = [21, 22, 23, 25, 53, 80, 110, 143, 443, 993, 995, 3306, 3389, 5432, 8080]
-            open_ports = await self.scanner.quick_port_scan(device['ip'], common_ports)
-            result.open_ports = open_ports
-        except Exception as e:
-            console.print(f"[yellow]Warning: Port scan failed for {device['ip']}: {e}[/yellow]")
+        if isinstance(open_ports, Exception):
+            console.print(f"[yellow]Warning: Port scan failed for {device['ip']}: {open_ports}[/yellow]")
             result.open_ports = []
+        else:
+            result.open_ports = open_ports
         
         return result
 
@@ -207,8 +272,13 @@ def main(mode: str, target: str, detailed: bool, quick: bool,
         # Initialize network mapper
         mapper = NetworkMapper(config_obj)
         
-        # Run scan
-        results = asyncio.run(
+        # Run scan, on the libuv-based event loop when it is installed (not available on Windows)
+        try:
+            import uvloop
+            run = uvloop.run
+        except ImportError:
+            run = asyncio.run
+        results = run(
             mapper.scan_network(target, mode, detailed)
         )
         
@@ -245,21 +315,7 @@ def _display_console_results(results: List[ScanResult], mode: str):
         table.add_column("Protocols", style="white")
     
     for result in results:
-        row = [
-            result.ip_address,
-            result.mac_address or "Unknown",
-            result.manufacturer or "Unknown",
-            result.device_type or "Unknown"
-        ]
-        
-        if mode == "local":
-            row.extend([
-                result.operating_system or "Unknown",
-                ", ".join(map(str, result.open_ports)) or "None",
-                ", ".join(result.protocols) or "None"
-            ])
-        
-        table.add_row(*row)
+        table.add_row(*result.as_row(mode))
     
     console.print(table)
 
@@ -6,7 +6,13 @@ import yaml
 import os
 from pathlib import Path
 from typing import Dict, Any, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
+
+# Prefer the libyaml C bindings when PyYAML was built with them
+try:
+    from yaml import CSafeLoader as _Loader, CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeLoader as _Loader, SafeDumper as _Dumper
 
 @dataclass
 class Config:
@@ -45,6 +51,7 @@ class Config:
     
     # Performance settings
     async_timeout: int = 10
+    max_concurrent_probes: int = 500
     connection_pool_size: int = 100
     
     @classmethod
@@ -56,29 +63,13 @@ class Config:
             return cls()
         
         with open(config_path, 'r') as f:
-            config_data = yaml.safe_load(f)
+            config_data = yaml.load(f, Loader=_Loader)
         
         return cls(**config_data)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert config to dictionary"""
-        return {
-            'timeout': self.timeout,
-            'max_concurrent_scans': self.max_concurrent_scans,
-            'retry_attempts': self.retry_attempts,
-            'default_ports': self.default_ports,
-            'detailed_scan_ports': self.detailed_scan_ports,
-            'service_detection': self.service_detection,
-            'os_detection': self.os_detection,
-            'protocol_analysis': self.protocol_analysis,
-            'quick_scan_ports': self.quick_scan_ports,
-            'mac_lookup_enabled': self.mac_lookup_enabled,
-            'mac_database_path': self.mac_database_path,
-            'output_directory': self.output_directory,
-            'log_level': self.log_level,
-            'async_timeout': self.async_timeout,
-            'connection_pool_size': self.connection_pool_size
-        }
+        return asdict(self)
     
     def save(self, config_path: str):
         """Save configuration to YAML file"""
@@ -86,4 +77,4 @@ class Config:
         config_path.parent.mkdir(parents=True, exist_ok=True)
         
         with open(config_path, 'w') as f:
-            yaml.dump(self.to_dict(), f, default_flow_style=False) 
\ No newline at end of file
+            yaml.dump(self.to_dict(), f, Dumper=_Dumper, default_flow_style=False) 
\ No newline at end of file
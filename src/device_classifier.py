@@ -3,145 +3,213 @@ Device classification and OS detection
 """
 
 import asyncio
+import os
 import re
 import socket
 import platform
+import struct
 import sys
-from typing import Dict, List, Any, Optional
-import nmap
+import time
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+try:
+    from scapy.layers.inet import IP, TCP
+    from scapy.sendrecv import sr
+    _HAS_SCAPY = True
+except ImportError:
+    _HAS_SCAPY = False
 
 from .config import Config
+from .net_utils import connect_scan, get_executor, icmp_checksum, is_port_open, nmap_scan
+
+# nmap arguments
+_ARGS_PORT_SERVICE = "-sS -sV -F --version-intensity 3"
+_ARGS_OS = "-O --osscan-guess"
+
+# Ports probed by quick_classify
+_QUICK_CLASSIFY_PORTS: Tuple[int, ...] = (22, 23, 80, 443, 3389, 9100)
+
+# Ports probed when nmap port/service detection is unavailable
+_FALLBACK_PORTS: Tuple[int, ...] = (21, 22, 23, 25, 53, 80, 110, 143, 443, 993, 995, 3306, 3389, 5432, 8080)
+
+# Device classification patterns
+_DEVICE_PATTERNS: Dict[str, Dict[str, Any]] = {
+    'router': {
+        'ports': frozenset({80, 443, 22, 23}),
+        'services': frozenset({'http', 'https', 'ssh', 'telnet'}),
+        'patterns': ['router', 'gateway', 'cisco', 'juniper', 'fortinet'],
+        'priority': 1
+    },
+    'switch': {
+        'ports': frozenset({22, 23, 80, 443}),
+        'services': frozenset({'ssh', 'telnet', 'http', 'https'}),
+        'patterns': ['switch', 'catalyst', 'nexus'],
+        'priority': 2
+    },
+    'server': {
+        'ports': frozenset({22, 80, 443, 3306, 5432, 27017}),
+        'services': frozenset({'ssh', 'http', 'https', 'mysql', 'postgresql', 'mongodb'}),
+        'patterns': ['server', 'apache', 'nginx', 'mysql', 'postgresql'],
+        'priority': 3
+    },
+    'printer': {
+        'ports': frozenset({80, 443, 631, 9100}),
+        'services': frozenset({'http', 'https', 'ipp', 'printer'}),
+        'patterns': ['printer', 'hp', 'canon', 'epson', 'brother'],
+        'priority': 4
+    },
+    'camera': {
+        'ports': frozenset({80, 443, 554, 8000}),
+        'services': frozenset({'http', 'https', 'rtsp'}),
+        'patterns': ['camera', 'ipcam', 'dvr', 'nvr'],
+        'priority': 5
+    },
+    'iot': {
+        'ports': frozenset({80, 443, 1883, 8883}),
+        'services': frozenset({'http', 'https', 'mqtt'}),
+        'patterns': ['iot', 'smart', 'home', 'automation'],
+        'priority': 6
+    },
+    'mobile': {
+        'ports': frozenset({80, 443}),
+        'services': frozenset({'http', 'https'}),
+        'patterns': ['mobile', 'android', 'ios', 'phone'],
+        'priority': 7
+    },
+    'workstation': {
+        'ports': frozenset({22, 80, 443, 3389}),
+        'services': frozenset({'ssh', 'http', 'https', 'rdp'}),
+        'patterns': ['windows', 'linux', 'mac', 'desktop'],
+        'priority': 8
+    }
+}
+
+# OS detection patterns
+_OS_PATTERNS: Dict[str, Dict[str, Any]] = {
+    'windows': {
+        'ports': frozenset({135, 139, 445, 3389}),
+        'services': frozenset({'msrpc', 'netbios-ssn', 'microsoft-ds', 'rdp'}),
+        'patterns': ['windows', 'microsoft', 'nt', 'win'],
+        'ttl_range': (128, 128)
+    },
+    'linux': {
+        'ports': frozenset({22, 80, 443}),
+        'services': frozenset({'ssh', 'http', 'https'}),
+        'patterns': ['linux', 'ubuntu', 'debian', 'centos', 'redhat'],
+        'ttl_range': (64, 64)
+    },
+    'macos': {
+        'ports': frozenset({22, 80, 443, 548}),
+        'services': frozenset({'ssh', 'http', 'https', 'afp'}),
+        'patterns': ['mac', 'darwin', 'apple'],
+        'ttl_range': (64, 64)
+    },
+    'ios': {
+        'ports': frozenset({22, 23, 80, 443}),
+        'services': frozenset({'ssh', 'telnet', 'http', 'https'}),
+        'patterns': ['cisco', 'ios', 'router'],
+        'ttl_range': (255, 255)
+    },
+    'android': {
+        'ports': frozenset({80, 443}),
+        'services': frozenset({'http', 'https'}),
+        'patterns': ['android', 'mobile'],
+        'ttl_range': (64, 64)
+    }
+}
+
+# TTL patterns in ping output for different platforms
+_TTL_PATTERNS = [
+    re.compile(r'ttl=(\d+)', re.IGNORECASE),  # Linux/macOS
+    re.compile(r'TTL=(\d+)', re.IGNORECASE),  # Windows
+    re.compile(r'Time to live=(\d+)', re.IGNORECASE)  # Alternative Windows format
+]
+
+def _is_privileged() -> bool:
+    """Whether raw packets can be sent (root on POSIX, admin assumed elsewhere)"""
+    return os.geteuid() == 0 if hasattr(os, 'geteuid') else True
 
 class DeviceClassifier:
     """Classify devices and detect operating systems"""
     
     def __init__(self, config: Config):
         self.config = config
-        self.nm = nmap.PortScanner()
+        self.executor = get_executor(config)
         self.device_patterns = self._load_device_patterns()
         self.os_patterns = self._load_os_patterns()
+        self._classification_cache: Dict[Tuple[Tuple[int, ...], Tuple[str, ...], str], str] = {}
+        
+        # Inverted indexes so scoring only walks a device's own ports/services
+        self._port_to_types = self._index_patterns(self.device_patterns, 'ports', 2)
+        self._service_to_types = self._index_patterns(self.device_patterns, 'services', 3)
+        
+        # Per-scan results of bulk nmap port/service scans: ip -> (open_ports, services)
+        self._bulk_results: Dict[str, Tuple[List[int], List[str]]] = {}
+    
+    def clear_scan_cache(self):
+        """Forget per-scan bulk scan results"""
+        self._bulk_results.clear()
+    
+    @staticmethod
+    def _index_patterns(patterns: Dict[str, Dict[str, Any]], field: str,
+                        weight: int) -> Dict[Any, List[Tuple[str, int]]]:
+        """Map each value of a pattern field to the (device_type, weight) pairs it scores"""
+        
+        index = defaultdict(list)
+        for device_type, pattern in patterns.items():
+            for value in pattern[field]:
+                index[value].append((device_type, weight))
+        
+        return dict(index)
     
     def _load_device_patterns(self) -> Dict[str, Dict[str, Any]]:
         """Load device classification patterns"""
-        return {
-            'router': {
-                'ports': [80, 443, 22, 23],
-                'services': ['http', 'https', 'ssh', 'telnet'],
-                'patterns': ['router', 'gateway', 'cisco', 'juniper', 'fortinet'],
-                'priority': 1
-            },
-            'switch': {
-                'ports': [22, 23, 80, 443],
-                'services': ['ssh', 'telnet', 'http', 'https'],
-                'patterns': ['switch', 'catalyst', 'nexus'],
-                'priority': 2
-            },
-            'server': {
-                'ports': [22, 80, 443, 3306, 5432, 27017],
-                'services': ['ssh', 'http', 'https', 'mysql', 'postgresql', 'mongodb'],
-                'patterns': ['server', 'apache', 'nginx', 'mysql', 'postgresql'],
-                'priority': 3
-            },
-            'printer': {
-                'ports': [80, 443, 631, 9100],
-                'services': ['http', 'https', 'ipp', 'printer'],
-                'patterns': ['printer', 'hp', 'canon', 'epson', 'brother'],
-                'priority': 4
-            },
-            'camera': {
-                'ports': [80, 443, 554, 8000],
-                'services': ['http', 'https', 'rtsp'],
-                'patterns': ['camera', 'ipcam', 'dvr', 'nvr'],
-                'priority': 5
-            },
-            'iot': {
-                'ports': [80, 443, 1883, 8883],
-                'services': ['http', 'https', 'mqtt'],
-                'patterns': ['iot', 'smart', 'home', 'automation'],
-                'priority': 6
-            },
-            'mobile': {
-                'ports': [80, 443],
-                'services': ['http', 'https'],
-                'patterns': ['mobile', 'android', 'ios', 'phone'],
-                'priority': 7
-            },
-            'workstation': {
-                'ports': [22, 80, 443, 3389],
-                'services': ['ssh', 'http', 'https', 'rdp'],
-                'patterns': ['windows', 'linux', 'mac', 'desktop'],
-                'priority': 8
-            }
-        }
+        return _DEVICE_PATTERNS
     
     def _load_os_patterns(self) -> Dict[str, Dict[str, Any]]:
         """Load OS detection patterns"""
-        return {
-            'windows': {
-                'ports': [135, 139, 445, 3389],
-                'services': ['msrpc', 'netbios-ssn', 'microsoft-ds', 'rdp'],
-                'patterns': ['windows', 'microsoft', 'nt', 'win'],
-                'ttl_range': (128, 128)
-            },
-            'linux': {
-                'ports': [22, 80, 443],
-                'services': ['ssh', 'http', 'https'],
-                'patterns': ['linux', 'ubuntu', 'debian', 'centos', 'redhat'],
-                'ttl_range': (64, 64)
-            },
-            'macos': {
-                'ports': [22, 80, 443, 548],
-                'services': ['ssh', 'http', 'https', 'afp'],
-                'patterns': ['mac', 'darwin', 'apple'],
-                'ttl_range': (64, 64)
-            },
-            'ios': {
-                'ports': [22, 23, 80, 443],
-                'services': ['ssh', 'telnet', 'http', 'https'],
-                'patterns': ['cisco', 'ios', 'router'],
-                'ttl_range': (255, 255)
-            },
-            'android': {
-                'ports': [80, 443],
-                'services': ['http', 'https'],
-                'patterns': ['android', 'mobile'],
-                'ttl_range': (64, 64)
-            }
-        }
+        return _OS_PATTERNS
     
     async def classify_device(self, device: Dict[str, Any]) -> Optional[str]:
         """Classify device type based on characteristics"""
         
-        device_score = {}
         ip = device['ip']
         
         # Get open ports and services
-        open_ports = await self._get_open_ports(ip)
-        services = await self._get_services(ip)
+        open_ports, services = await self._scan_ports_and_services(ip)
         
-        # Score each device type
-        for device_type, pattern in self.device_patterns.items():
-            score = 0
-            
-            # Port matching
-            for port in open_ports:
-                if port in pattern['ports']:
-                    score += 2
-            
-            # Service matching
-            for service in services:
-                if service in pattern['services']:
-                    score += 3
-            
-            # Pattern matching in hostname/banner
-            hostname = device.get('hostname', '')
-            if hostname:
-                hostname = hostname.lower()
+        # Scoring is pure over (ports, services, hostname), so reuse earlier results
+        key = (tuple(open_ports), tuple(services), device.get('hostname') or '')
+        if key not in self._classification_cache:
+            self._classification_cache[key] = self._score_device(*key)
+        
+        return self._classification_cache[key]
+    
+    def _score_device(self, open_ports: Tuple[int, ...], services: Tuple[str, ...],
+                      hostname: str) -> str:
+        """Score each device type and return the best match"""
+        
+        # Keep pattern order so ties resolve the same way as before
+        device_score = dict.fromkeys(self.device_patterns, 0)
+        hostname = hostname.lower()
+        
+        # Port matching
+        for port in open_ports:
+            for device_type, weight in self._port_to_types.get(port, ()):
+                device_score[device_type] += weight
+        
+        # Service matching
+        for service in services:
+            for device_type, weight in self._service_to_types.get(service, ()):
+                device_score[device_type] += weight
+        
+        # Pattern matching in hostname/banner
+        if hostname:
+            for device_type, pattern in self.device_patterns.items():
                 for pattern_str in pattern['patterns']:
                     if pattern_str in hostname:
-                        score += 5
-            
-            device_score[device_type] = score
+                        device_score[device_type] += 5
         
         # Return device type with highest score
         if device_score:
@@ -156,16 +224,28 @@ class DeviceClassifier:
         
         ip = device['ip']
         
-        # Quick port scan for common ports
-        common_ports = [22, 23, 80, 443, 3389, 9100]
-        open_ports = await self._quick_port_check(ip, common_ports)
+        # Quick port scan for common ports, deciding as soon as a single port settles it
+        tasks = [asyncio.create_task(self._check_port(ip, port, 2)) for port in _QUICK_CLASSIFY_PORTS]
+        open_ports = set()
+        closed_ports = set()
+        
+        try:
+            for future in asyncio.as_completed(tasks):
+                port, is_open = await future
+                (open_ports if is_open else closed_ports).add(port)
+                
+                # 9100 always wins; 3389 wins once 9100 is known to be closed
+                if 9100 in open_ports:
+                    return 'printer'
+                if 3389 in open_ports and 9100 in closed_ports:
+                    return 'workstation'
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
         
         # Simple classification based on ports
-        if 9100 in open_ports:
-            return 'printer'
-        elif 3389 in open_ports:
-            return 'workstation'
-        elif 22 in open_ports and 80 in open_ports:
+        if 22 in open_ports and 80 in open_ports:
             return 'server'
         elif 80 in open_ports or 443 in open_ports:
             return 'device'
@@ -179,11 +259,10 @@ class DeviceClassifier:
         
         try:
             # Use nmap for OS detection
-            scan_args = f"-O --osscan-guess {ip}"
-            self.nm.scan(hosts=ip, arguments=scan_args)
+            hosts = await self._nmap_scan(ip, _ARGS_OS)
             
-            if ip in self.nm.all_hosts():
-                os_info = self.nm[ip].get('osmatch', [])
+            if ip in hosts:
+                os_info = hosts[ip].get('osmatch', [])
                 if os_info:
                     return os_info[0]['name']
         
@@ -196,6 +275,52 @@ class DeviceClassifier:
     async def _detect_os_by_ttl(self, ip: str) -> Optional[str]:
         """Detect OS using TTL values"""
         
+        # Read the TTL straight from an ICMP echo reply when raw sockets are allowed
+        try:
+            loop = asyncio.get_running_loop()
+            ttl = await loop.run_in_executor(self.executor, self._icmp_echo_ttl, ip, 1.0)
+            return self._classify_ttl(ttl) if ttl is not None else None
+        except OSError:
+            # Raw sockets need root/CAP_NET_RAW; fall back to the ping command
+            pass
+        
+        return await self._detect_os_by_ping_ttl(ip)
+    
+    @staticmethod
+    def _icmp_echo_ttl(ip: str, timeout: float) -> Optional[int]:
+        """Send one ICMP echo request and return the TTL of the reply"""
+        
+        ident = os.getpid() & 0xFFFF
+        header = struct.pack('!BBHHH', 8, 0, 0, ident, 1)
+        payload = b'network-mapper'
+        checksum = icmp_checksum(header + payload)
+        packet = struct.pack('!BBHHH', 8, 0, checksum, ident, 1) + payload
+        
+        with socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP) as sock:
+            sock.sendto(packet, (ip, 0))
+            
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                sock.settimeout(remaining)
+                try:
+                    reply, addr = sock.recvfrom(1024)
+                except socket.timeout:
+                    return None
+                
+                # Skip the IP header and match our echo reply
+                header_len = (reply[0] & 0x0F) * 4
+                if addr[0] != ip or len(reply) < header_len + 8:
+                    continue
+                icmp_type, _, _, reply_ident, _ = struct.unpack('!BBHHH', reply[header_len:header_len + 8])
+                if icmp_type == 0 and reply_ident == ident:
+                    return reply[8]
+    
+    async def _detect_os_by_ping_ttl(self, ip: str) -> Optional[str]:
+        """Detect OS using the TTL reported by the ping command"""
+        
         try:
             system = platform.system().lower()
             
@@ -204,117 +329,149 @@ class DeviceClassifier:
                 proc = await asyncio.create_subprocess_exec(
                     'ping', '-n', '1', ip,
                     stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
+                    stderr=asyncio.subprocess.DEVNULL
                 )
             else:
                 # Linux/macOS ping command
                 proc = await asyncio.create_subprocess_exec(
                     'ping', '-c', '1', ip,
                     stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
+                    stderr=asyncio.subprocess.DEVNULL
                 )
             
-            stdout, stderr = await proc.communicate()
-            
-            if proc.returncode == 0:
-                # Extract TTL from ping output
-                output = stdout.decode()
-                
-                # Handle different TTL patterns for different platforms
-                ttl_patterns = [
-                    r'ttl=(\d+)',  # Linux/macOS
-                    r'TTL=(\d+)',  # Windows
-                    r'Time to live=(\d+)'  # Alternative Windows format
-                ]
-                
-                for pattern in ttl_patterns:
-                    ttl_match = re.search(pattern, output, re.IGNORECASE)
-                    if ttl_match:
-                        ttl = int(ttl_match.group(1))
-                        
-                        # Classify based on TTL
-                        if ttl <= 64:
-                            return 'Linux/macOS'
-                        elif ttl <= 128:
-                            return 'Windows'
-                        elif ttl <= 255:
-                            return 'Network Device'
-                        else:
-                            return 'Unknown'
+            try:
+                # The TTL shows up on the first reply line, so stop reading there
+                while line := await proc.stdout.readline():
+                    output = line.decode(errors='ignore')
+                    
+                    # Handle different TTL patterns for different platforms
+                    for pattern in _TTL_PATTERNS:
+                        ttl_match = pattern.search(output)
+                        if ttl_match:
+                            return self._classify_ttl(int(ttl_match.group(1)))
+            finally:
+                if proc.returncode is None:
+                    try:
+                        proc.kill()
+                    except ProcessLookupError:
+                        pass
+                await proc.wait()
         
         except Exception:
             pass
         
         return None
     
-    async def _get_open_ports(self, ip: str) -> List[int]:
-        """Get open ports for a device"""
+    @staticmethod
+    def _classify_ttl(ttl: int) -> str:
+        """Classify OS family based on TTL"""
         
-        open_ports = []
+        if ttl <= 64:
+            return 'Linux/macOS'
+        elif ttl <= 128:
+            return 'Windows'
+        elif ttl <= 255:
+            return 'Network Device'
+        else:
+            return 'Unknown'
+    
+    async def prefetch_ports_and_services(self, ips: List[str]):
+        """Scan ports and services for many devices with one nmap run"""
         
-        try:
-            # Quick port scan
-            scan_args = f"-sS -F {ip}"
-            self.nm.scan(hosts=ip, arguments=scan_args)
-            
-            if ip in self.nm.all_hosts():
-                for proto in self.nm[ip].all_protocols():
-                    ports = self.nm[ip][proto].keys()
-                    open_ports.extend(ports)
+        if not ips:
+            return
         
+        try:
+            self._bulk_results.update(await self._bulk_scan(ips, _ARGS_PORT_SERVICE))
         except Exception:
-            # Fallback to basic port checking
-            common_ports = [21, 22, 23, 25, 53, 80, 110, 143, 443, 993, 995, 3306, 3389, 5432, 8080]
-            open_ports = await self._quick_port_check(ip, common_ports)
+            # Leave devices to be scanned individually
+            pass
+    
+    async def _bulk_scan(self, ips: List[str], args: str) -> Dict[str, Tuple[List[int], List[str]]]:
+        """Run one nmap scan over a list of IPs and split the result per host"""
         
-        return open_ports
+        hosts = await self._nmap_scan(' '.join(ips), args)
+        
+        results = {}
+        for ip in ips:
+            results[ip] = self._parse_ports_and_services(hosts[ip]) if ip in hosts else ([], [])
+        
+        return results
+    
+    async def _nmap_scan(self, hosts: str, args: str) -> Dict[str, Any]:
+        """Run a blocking nmap scan in the worker pool and return its per-host results"""
+        
+        # Each pool thread scans with its own PortScanner; python-nmap parses the
+        # instance's last output, which concurrent scans on one instance would overwrite
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, nmap_scan, hosts, args)
     
-    async def _get_services(self, ip: str) -> List[str]:
-        """Get services running on a device"""
+    @staticmethod
+    def _parse_ports_and_services(host: Any) -> Tuple[List[int], List[str]]:
+        """Collect open ports and service names from one host's nmap result"""
+        
+        open_ports = []
+        services = []
+        
+        for proto in host.all_protocols():
+            for port, service_info in host[proto].items():
+                open_ports.append(port)
+                services.append(service_info.get('name', 'unknown'))
         
+        return open_ports, services
+    
+    async def _scan_ports_and_services(self, ip: str) -> Tuple[List[int], List[str]]:
+        """Get open ports and running services for a device in a single scan"""
+        
+        # Use the result of an earlier bulk scan when there is one
+        if ip in self._bulk_results:
+            return self._bulk_results[ip]
+        
+        open_ports = []
         services = []
         
         try:
-            # Service detection scan
-            scan_args = f"-sV --version-intensity 3 {ip}"
-            self.nm.scan(hosts=ip, arguments=scan_args)
+            # Combined port and service detection scan
+            hosts = await self._nmap_scan(ip, _ARGS_PORT_SERVICE)
             
-            if ip in self.nm.all_hosts():
-                for proto in self.nm[ip].all_protocols():
-                    ports = self.nm[ip][proto].keys()
-                    for port in ports:
-                        service_info = self.nm[ip][proto][port]
-                        service_name = service_info.get('name', 'unknown')
-                        services.append(service_name)
+            if ip in hosts:
+                open_ports, services = self._parse_ports_and_services(hosts[ip])
         
         except Exception:
-            pass
+            # Fallback to basic port checking
+            open_ports = await self._quick_port_check(ip, _FALLBACK_PORTS)
         
-        return services
+        return open_ports, services
     
-    async def _quick_port_check(self, ip: str, ports: List[int]) -> List[int]:
+    async def _quick_port_check(self, ip: str, ports: Sequence[int]) -> List[int]:
         """Quick port availability check"""
         
-        open_ports = []
-        
-        async def check_port(port):
+        # Run the blocking probe off the event loop, preferring a batched SYN scan when privileged
+        loop = asyncio.get_running_loop()
+        open_ports = None
+        if _HAS_SCAPY and _is_privileged():
             try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(ip, port),
-                    timeout=2
-                )
-                writer.close()
-                await writer.wait_closed()
-                return port
+                open_ports = await loop.run_in_executor(self.executor, self._syn_scan, ip, ports, 1)
             except Exception:
-                return None
+                pass
+        if open_ports is None:
+            open_ports = sorted(await loop.run_in_executor(self.executor, connect_scan, ip, ports, 2))
+        
+        return open_ports
+    
+    async def _check_port(self, ip: str, port: int, timeout: float) -> Tuple[int, bool]:
+        """Check whether a single TCP port accepts connections"""
+        return port, await is_port_open(ip, port, timeout)
+    
+    @staticmethod
+    def _syn_scan(ip: str, ports: Sequence[int], timeout: float) -> List[int]:
+        """Send one batch of SYN packets and collect ports answering with SYN/ACK"""
         
-        # Check ports concurrently
-        tasks = [check_port(port) for port in ports]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        answered, _ = sr(IP(dst=ip) / TCP(dport=list(ports), flags='S'), timeout=timeout, verbose=0)
         
-        for result in results:
-            if result and isinstance(result, int):
-                open_ports.append(result)
+        open_ports = set()
+        for sent, received in answered:
+            if received.haslayer(TCP) and (int(received[TCP].flags) & 0x12) == 0x12:
+                open_ports.add(sent[TCP].dport)
         
-        return open_ports 
\ No newline at end of file
+        return sorted(open_ports)
\ No newline at end of file
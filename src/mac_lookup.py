@@ -4,7 +4,7 @@ MAC address lookup and manufacturer identification
 
 import aiohttp
 import asyncio
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import json
 import re
 
@@ -16,6 +16,8 @@ class MACLookup:
     def __init__(self, config: Config):
         self.config = config
         self.cache = {}
+        # In-flight lookups by OUI, so concurrent callers share one API request
+        self._lookups: Dict[str, asyncio.Future] = {}
         self.api_urls = [
             "https://api.macvendors.com",
             "https://api.macaddress.io/v1"
@@ -37,23 +39,34 @@ class MACLookup:
         if mac in self.cache:
             return self.cache[mac]
         
+        lookup = self._lookups.get(mac)
+        if lookup is None:
+            lookup = self._lookups[mac] = asyncio.ensure_future(self._lookup(mac))
+            lookup.add_done_callback(lambda _: self._lookups.pop(mac, None))
+        
+        # Shield the shared lookup so one cancelled caller doesn't cancel the others
+        return await asyncio.shield(lookup)
+    
+    async def _lookup(self, mac: str) -> Optional[str]:
+        """Look an OUI up through the APIs, then the local database, and cache the answer"""
+        
         # Try multiple API sources
-        manufacturer = await self._query_apis(mac)
-        if manufacturer:
-            self.cache[mac] = manufacturer
-            return manufacturer
+        manufacturer, not_found = await self._query_apis(mac)
         
         # Fallback to local database
-        manufacturer = self._local_lookup(mac)
-        if manufacturer:
+        if not manufacturer:
+            manufacturer = self._local_lookup(mac)
+        
+        # Only cache a miss the APIs confirmed, not one caused by errors or rate limits
+        if manufacturer or not_found:
             self.cache[mac] = manufacturer
-            return manufacturer
         
-        return None
+        return manufacturer
     
-    async def _query_apis(self, mac: str) -> Optional[str]:
-        """Query multiple MAC vendor APIs"""
+    async def _query_apis(self, mac: str) -> Tuple[Optional[str], bool]:
+        """Query multiple MAC vendor APIs, returning the manufacturer and whether any API reported the OUI unknown"""
         
+        not_found = False
         for api_url in self.api_urls:
             try:
                 async with aiohttp.ClientSession() as session:
@@ -62,11 +75,14 @@ class MACLookup:
                         if response.status == 200:
                             manufacturer = await response.text()
                             if manufacturer and manufacturer != "Not Found":
-                                return manufacturer.strip()
+                                return manufacturer.strip(), False
+                            not_found = True
+                        elif response.status == 404:
+                            not_found = True
             except Exception:
                 continue
         
-        return None
+        return None, not_found
     
     def _clean_mac(self, mac: str) -> Optional[str]:
         """Clean and validate MAC address"""
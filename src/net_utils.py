@@ -0,0 +1,132 @@
+"""
+Low-level socket and nmap helpers shared by the scanning modules
+"""
+
+import asyncio
+import atexit
+import errno
+import selectors
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Sequence, Set
+import nmap
+
+from .config import Config
+
+# connect_ex() results meaning the non-blocking connect is still in progress
+CONNECT_PENDING = {errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)}
+
+# Worker pool shared by the scanner and classifier, created on first use
+_SHARED_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def get_executor(config: Config) -> ThreadPoolExecutor:
+    """Get the shared worker pool for blocking nmap runs and connect batches"""
+    global _SHARED_EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _SHARED_EXECUTOR is None:
+            # The work is I/O-bound; each concurrently scanned device can hold a long
+            # nmap run and a short probe at once, so CPU count doesn't matter
+            workers = 2 * max(1, config.max_concurrent_scans)
+            _SHARED_EXECUTOR = ThreadPoolExecutor(max_workers=workers)
+            atexit.register(_SHARED_EXECUTOR.shutdown)
+        return _SHARED_EXECUTOR
+
+class LoopSemaphore:
+    """Semaphore created lazily inside the running event loop, and recreated if the loop changes"""
+    
+    def __init__(self, limit: int):
+        self._limit = max(1, limit)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def get(self) -> asyncio.Semaphore:
+        """Get the semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self._limit)
+            self._loop = loop
+        return self._semaphore
+
+# python-nmap keeps each scan's output on the PortScanner instance, so every
+# worker thread gets its own
+_thread_state = threading.local()
+
+def thread_port_scanner() -> nmap.PortScanner:
+    """Get the calling thread's nmap PortScanner"""
+    scanner = getattr(_thread_state, 'port_scanner', None)
+    if scanner is None:
+        scanner = _thread_state.port_scanner = nmap.PortScanner()
+    return scanner
+
+# Callers keep constant argument strings; targets always go through hosts=
+def nmap_scan(hosts: str, args: str) -> Dict[str, Any]:
+    """Run a blocking nmap scan on the calling thread's PortScanner and return its per-host results"""
+    return thread_port_scanner().scan(hosts=hosts, arguments=args).get('scan', {})
+
+def icmp_checksum(data: bytes) -> int:
+    """Compute the RFC 1071 internet checksum"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+async def is_port_open(ip: str, port: int, timeout: float) -> bool:
+    """Check whether a TCP port accepts connections using a bare socket"""
+    
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout=timeout)
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        sock.close()
+
+def connect_scan(ip: str, ports: Sequence[int], timeout: float) -> Set[int]:
+    """Check TCP reachability of a batch of ports with non-blocking connects (blocking call)"""
+    
+    open_ports = set()
+    selector = selectors.DefaultSelector()
+    sockets = []
+    
+    try:
+        # Start all connects up front
+        for port in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sockets.append(sock)
+            result = sock.connect_ex((ip, port))
+            if result == 0:
+                open_ports.add(port)
+            elif result in CONNECT_PENDING:
+                selector.register(sock, selectors.EVENT_WRITE, port)
+        
+        # Collect connects that complete within the timeout
+        deadline = time.monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                selector.unregister(key.fileobj)
+                if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    open_ports.add(key.data)
+    
+    except Exception:
+        pass
+    
+    finally:
+        selector.close()
+        for sock in sockets:
+            sock.close()
+    
+    return open_ports
@@ -3,13 +3,177 @@ Protocol analysis and deep packet inspection
 """
 
 import asyncio
+import re
 import socket
 import struct
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 import aiohttp
 import json
 
+try:
+    import ahocorasick
+    _HAS_AHOCORASICK = True
+except ImportError:
+    _HAS_AHOCORASICK = False
+
 from .config import Config
+from .net_utils import LoopSemaphore, is_port_open
+
+# Protocol detection patterns; protocols with probe_first False send a banner
+# on connect, so they are only read from
+_PROTOCOL_PATTERNS: Dict[str, Dict[str, Any]] = {
+    'http': {
+        'ports': [80, 8080, 8443],
+        'patterns': [b'GET ', b'POST ', b'HTTP/'],
+        'probe_first': True,
+        'name': 'HTTP'
+    },
+    'https': {
+        'ports': [443, 8443],
+        'patterns': [b'\x16\x03', b'\x17\x03'],  # TLS handshake
+        'probe_first': True,
+        'name': 'HTTPS'
+    },
+    'ssh': {
+        'ports': [22],
+        'patterns': [b'SSH-'],
+        'probe_first': False,
+        'name': 'SSH'
+    },
+    'ftp': {
+        'ports': [21],
+        'patterns': [b'220 ', b'FTP'],
+        'probe_first': False,
+        'name': 'FTP'
+    },
+    'smtp': {
+        'ports': [25, 587],
+        'patterns': [b'220 ', b'SMTP'],
+        'probe_first': False,
+        'name': 'SMTP'
+    },
+    'pop3': {
+        'ports': [110, 995],
+        'patterns': [b'+OK ', b'POP3'],
+        'probe_first': False,
+        'name': 'POP3'
+    },
+    'imap': {
+        'ports': [143, 993],
+        'patterns': [b'* OK ', b'IMAP'],
+        'probe_first': False,
+        'name': 'IMAP'
+    },
+    'dns': {
+        'ports': [53],
+        'patterns': [b'\x00\x01', b'\x00\x02'],  # DNS query patterns
+        'probe_first': True,
+        'name': 'DNS'
+    },
+    'mysql': {
+        'ports': [3306],
+        'patterns': [b'\x0a'],  # MySQL protocol version
+        'probe_first': True,
+        'name': 'MySQL'
+    },
+    'postgresql': {
+        'ports': [5432],
+        'patterns': [b'\x00\x00\x00\x08'],  # PostgreSQL startup message
+        'probe_first': True,
+        'name': 'PostgreSQL'
+    },
+    'rdp': {
+        'ports': [3389],
+        'patterns': [b'\x03\x00'],  # RDP protocol
+        'probe_first': True,
+        'name': 'RDP'
+    }
+}
+
+# Probe sent to elicit a response for each protocol
+_PROTOCOL_PROBES: Dict[str, bytes] = {
+    'http': b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n',
+    'https': b'\x16\x03\x01\x00\x01\x01',  # TLS ClientHello
+    'ssh': b'SSH-2.0-OpenSSH_8.1\r\n',
+    'ftp': b'USER anonymous\r\n',
+    'smtp': b'EHLO localhost\r\n',
+    'pop3': b'USER test\r\n',
+    'imap': b'a001 CAPABILITY\r\n',
+    'dns': b'\x00\x01\x00\x00\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01',
+    'mysql': b'\x0a',  # MySQL protocol version
+    'postgresql': b'\x00\x00\x00\x08\x04\xd2\x16\x2f',  # PostgreSQL startup
+    'rdp': b'\x03\x00\x00\x13\x0e\xe0\x00\x00\x00\x00\x00\x01\x00\x08\x00\x03\x00\x00\x00'  # RDP connection request
+}
+
+# Common application protocols detected by a successful connect alone
+_APP_PROTOCOLS = [
+    (8080, 'HTTP-Proxy'),
+    (8443, 'HTTPS-Alt'),
+    (8888, 'HTTP-Alt'),
+    (9000, 'Jenkins'),
+    (9090, 'HTTP-Alt'),
+    (27017, 'MongoDB'),
+    (6379, 'Redis'),
+    (11211, 'Memcached'),
+    (5672, 'AMQP'),
+    (1883, 'MQTT'),
+    (8883, 'MQTT-SSL')
+]
+
+# Response signatures identifying a protocol, in priority order
+_PROTOCOL_SIGNATURES = (
+    (b'HTTP/', 'HTTP'),
+    (b'SSH-', 'SSH'),
+    (b'FTP', 'FTP'),
+    (b'SMTP', 'SMTP'),
+    (b'POP3', 'POP3'),
+    (b'IMAP', 'IMAP'),
+    (b'MySQL', 'MySQL'),
+    (b'PostgreSQL', 'PostgreSQL')
+)
+
+# Common version patterns, one alternative per protocol
+_VERSION_RE = re.compile(
+    r'HTTP/(\d+\.\d+)'
+    r'|SSH-(\d+\.\d+)'
+    r'|FTP server \(([^)]+)\)'
+    r'|PostgreSQL/(\d+\.\d+)'
+    r'|MySQL/(\d+\.\d+)'
+)
+
+# Capability reported when any of its (lowercase) keywords appears in a response
+_CAPABILITY_KEYWORDS = [
+    ('SSL/TLS', (b'ssl', b'tls')),
+    ('Authentication', (b'authentication',)),
+    ('Compression', (b'compression',)),
+    ('Encryption', (b'encryption',))
+]
+
+# ASCII-only lowercase table; capability keywords are plain ASCII, so banners
+# can be lowercased as bytes without a UTF-8 decode
+_LOWER_TABLE = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
+
+def _build_matcher(tags_by_pattern: Dict[str, Tuple[str, ...]]) -> Optional[Any]:
+    """Build an Aho-Corasick automaton mapping each pattern to its tags"""
+    # Byte patterns are stored as latin-1 text (one character per byte), so
+    # responses are matched after a latin-1 decode
+    if not _HAS_AHOCORASICK:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for pattern, tags in tags_by_pattern.items():
+        automaton.add_word(pattern, tags)
+    automaton.make_automaton()
+    return automaton
+
+def _match_tags(automaton: Any, text: str) -> Set[str]:
+    """Collect the tags of every pattern found in text, in a single pass"""
+    return {tag for _, tags in automaton.iter(text) for tag in tags}
+
+_CAPABILITY_MATCHER = _build_matcher({
+    keyword.decode('latin-1'): (capability,)
+    for capability, keywords in _CAPABILITY_KEYWORDS for keyword in keywords
+})
 
 class ProtocolAnalyzer:
     """Analyze network protocols and application layer data"""
@@ -17,175 +181,159 @@ class ProtocolAnalyzer:
     def __init__(self, config: Config):
         self.config = config
         self.protocol_patterns = self._load_protocol_patterns()
+        self._protocol_matcher = self._build_protocol_matcher()
+        
+        # App-protocol ports not already probed for a protocol pattern need their own connect
+        pattern_ports = {port for info in self.protocol_patterns.values() for port in info['ports']}
+        self._extra_ports = [(port, name) for port, name in _APP_PROTOCOLS if port not in pattern_ports]
+        
+        # Limits probes across every device being analyzed
+        self._probe_semaphore = LoopSemaphore(config.max_concurrent_probes)
+    
+    def _build_protocol_matcher(self) -> Optional[Any]:
+        """Build one multi-pattern matcher over every protocol's banner patterns"""
+        
+        tags_by_pattern = {}
+        for protocol, info in self.protocol_patterns.items():
+            for pattern in info['patterns']:
+                key = pattern.decode('latin-1')
+                tags_by_pattern[key] = tags_by_pattern.get(key, ()) + (protocol,)
+        
+        return _build_matcher(tags_by_pattern)
     
     def _load_protocol_patterns(self) -> Dict[str, Dict[str, Any]]:
         """Load protocol detection patterns"""
-        return {
-            'http': {
-                'ports': [80, 8080, 8443],
-                'patterns': [b'GET ', b'POST ', b'HTTP/'],
-                'name': 'HTTP'
-            },
-            'https': {
-                'ports': [443, 8443],
-                'patterns': [b'\x16\x03', b'\x17\x03'],  # TLS handshake
-                'name': 'HTTPS'
-            },
-            'ssh': {
-                'ports': [22],
-                'patterns': [b'SSH-'],
-                'name': 'SSH'
-            },
-            'ftp': {
-                'ports': [21],
-                'patterns': [b'220 ', b'FTP'],
-                'name': 'FTP'
-            },
-            'smtp': {
-                'ports': [25, 587],
-                'patterns': [b'220 ', b'SMTP'],
-                'name': 'SMTP'
-            },
-            'pop3': {
-                'ports': [110, 995],
-                'patterns': [b'+OK ', b'POP3'],
-                'name': 'POP3'
-            },
-            'imap': {
-                'ports': [143, 993],
-                'patterns': [b'* OK ', b'IMAP'],
-                'name': 'IMAP'
-            },
-            'dns': {
-                'ports': [53],
-                'patterns': [b'\x00\x01', b'\x00\x02'],  # DNS query patterns
-                'name': 'DNS'
-            },
-            'mysql': {
-                'ports': [3306],
-                'patterns': [b'\x0a'],  # MySQL protocol version
-                'name': 'MySQL'
-            },
-            'postgresql': {
-                'ports': [5432],
-                'patterns': [b'\x00\x00\x00\x08'],  # PostgreSQL startup message
-                'name': 'PostgreSQL'
-            },
-            'rdp': {
-                'ports': [3389],
-                'patterns': [b'\x03\x00'],  # RDP protocol
-                'name': 'RDP'
-            }
-        }
+        return _PROTOCOL_PATTERNS
     
     async def analyze_device(self, ip: str) -> List[str]:
         """Analyze protocols used by a device"""
         
-        protocols = []
+        # Probe every distinct (port, probe) pair once, all concurrently
+        # (a probe of None only checks that the port accepts connections,
+        # an empty probe reads the banner without sending anything)
+        probes = list(
+            {(port, self._get_request(protocol, info))
+             for protocol, info in self.protocol_patterns.items()
+             for port in info['ports']}
+            | {(port, None) for port, _ in self._extra_ports}
+        )
+        semaphore = self._probe_semaphore.get()
+        
+        async def bounded_probe(port, probe):
+            async with semaphore:
+                return await self._probe_port(ip, port, probe)
+        
+        results = await asyncio.gather(
+            *[bounded_probe(port, probe) for port, probe in probes],
+            return_exceptions=True
+        )
+        responses = {
+            probe: result for probe, result in zip(probes, results)
+            if not isinstance(result, BaseException)
+        }
+        
+        # Collect into a set so duplicates never build up
+        protocols: Set[str] = set()
         
         # Test common protocols
-        for protocol, info in self.protocol_patterns.items():
-            if await self._test_protocol(ip, protocol, info):
-                protocols.append(info['name'])
+        protocols.update(
+            info['name'] for protocol, info in self.protocol_patterns.items()
+            if self._test_protocol(protocol, info, responses)
+        )
         
         # Additional protocol detection
-        additional_protocols = await self._detect_additional_protocols(ip)
-        protocols.extend(additional_protocols)
+        protocols.update(self._detect_additional_protocols(responses))
         
-        return list(set(protocols))  # Remove duplicates
+        return list(protocols)
     
-    async def _test_protocol(self, ip: str, protocol: str, info: Dict[str, Any]) -> bool:
-        """Test if a specific protocol is supported"""
+    async def _probe_port(self, ip: str, port: int, probe: Optional[bytes]) -> Optional[bytes]:
+        """Connect to a port and return the probe response, or None if unreachable"""
         
-        for port in info['ports']:
+        # Connect-only checks don't need a stream reader/writer pair
+        if probe is None:
+            return b'' if await is_port_open(ip, port, 2) else None
+        
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port),
+                timeout=self.config.async_timeout
+            )
+        except Exception:
+            return None
+        
+        response = b''
+        
+        try:
+            # Send a basic probe based on protocol, unless the server speaks first
+            if probe:
+                writer.write(probe)
+                await writer.drain()
+            
+            # Read response
             try:
-                # Try to connect and send a probe
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(ip, port),
-                    timeout=self.config.async_timeout
+                response = await asyncio.wait_for(
+                    reader.read(1024),
+                    timeout=2
                 )
-                
-                # Send a basic probe based on protocol
-                probe = self._get_protocol_probe(protocol)
-                if probe:
-                    writer.write(probe)
-                    await writer.drain()
-                
-                # Read response
-                try:
-                    response = await asyncio.wait_for(
-                        reader.read(1024),
-                        timeout=2
-                    )
-                    
-                    # Check for protocol patterns
-                    for pattern in info['patterns']:
-                        if pattern in response:
-                            writer.close()
-                            await writer.wait_closed()
-                            return True
-                
-                except asyncio.TimeoutError:
-                    pass
-                
-                writer.close()
+            except asyncio.TimeoutError:
+                pass
+        
+        except Exception:
+            pass
+        
+        finally:
+            writer.close()
+            try:
                 await writer.wait_closed()
-            
             except Exception:
+                pass
+        
+        return response
+    
+    def _test_protocol(self, protocol: str, info: Dict[str, Any],
+                       responses: Dict[Tuple[int, Optional[bytes]], Optional[bytes]]) -> bool:
+        """Test if a specific protocol is supported, given the probe responses"""
+        
+        probe = self._get_request(protocol, info)
+        
+        for port in info['ports']:
+            response = responses.get((port, probe))
+            if not response:
                 continue
+            
+            # Check for protocol patterns
+            if self._protocol_matcher is not None:
+                if protocol in _match_tags(self._protocol_matcher, response.decode('latin-1')):
+                    return True
+                continue
+            
+            for pattern in info['patterns']:
+                if pattern in response:
+                    return True
         
         return False
     
-    def _get_protocol_probe(self, protocol: str) -> Optional[bytes]:
+    @staticmethod
+    def _get_protocol_probe(protocol: str) -> Optional[bytes]:
         """Get appropriate probe for protocol detection"""
-        
-        probes = {
-            'http': b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n',
-            'https': b'\x16\x03\x01\x00\x01\x01',  # TLS ClientHello
-            'ssh': b'SSH-2.0-OpenSSH_8.1\r\n',
-            'ftp': b'USER anonymous\r\n',
-            'smtp': b'EHLO localhost\r\n',
-            'pop3': b'USER test\r\n',
-            'imap': b'a001 CAPABILITY\r\n',
-            'dns': b'\x00\x01\x00\x00\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01',
-            'mysql': b'\x0a',  # MySQL protocol version
-            'postgresql': b'\x00\x00\x00\x08\x04\xd2\x16\x2f',  # PostgreSQL startup
-            'rdp': b'\x03\x00\x00\x13\x0e\xe0\x00\x00\x00\x00\x00\x01\x00\x08\x00\x03\x00\x00\x00'  # RDP connection request
-        }
-        
-        return probes.get(protocol)
+        return _PROTOCOL_PROBES.get(protocol)
     
-    async def _detect_additional_protocols(self, ip: str) -> List[str]:
+    def _get_request(self, protocol: str, info: Dict[str, Any]) -> Optional[bytes]:
+        """Get the bytes to send for a protocol, empty for banner-first protocols"""
+        return self._get_protocol_probe(protocol) if info['probe_first'] else b''
+    
+    def _detect_additional_protocols(self, responses: Dict[Tuple[int, Optional[bytes]], Optional[bytes]]) -> List[str]:
         """Detect additional protocols not in standard patterns"""
         
         additional_protocols = []
         
+        # Any probe that connected shows the port is open
+        open_ports = {port for (port, _), response in responses.items() if response is not None}
+        
         # Test for common application protocols
-        app_protocols = [
-            (8080, 'HTTP-Proxy'),
-            (8443, 'HTTPS-Alt'),
-            (8888, 'HTTP-Alt'),
-            (9000, 'Jenkins'),
-            (9090, 'HTTP-Alt'),
-            (27017, 'MongoDB'),
-            (6379, 'Redis'),
-            (11211, 'Memcached'),
-            (5672, 'AMQP'),
-            (1883, 'MQTT'),
-            (8883, 'MQTT-SSL')
-        ]
-        
-        for port, protocol_name in app_protocols:
-            try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(ip, port),
-                    timeout=2
-                )
-                writer.close()
-                await writer.wait_closed()
+        for port, protocol_name in _APP_PROTOCOLS:
+            if port in open_ports:
                 additional_protocols.append(protocol_name)
-            except Exception:
-                continue
         
         return additional_protocols
     
@@ -217,10 +365,11 @@ class ProtocolAnalyzer:
                     timeout=3
                 )
                 
-                # Analyze response
-                analysis['banner'] = response.decode('utf-8', errors='ignore')[:200]
+                # Analyze response, decoding it only once
+                text = response.decode('utf-8', errors='ignore')
+                analysis['banner'] = text[:200]
                 analysis['protocol'] = self._identify_protocol_from_response(response)
-                analysis['version'] = self._extract_version_from_response(response)
+                analysis['version'] = self._extract_version_from_response(text)
                 analysis['capabilities'] = self._extract_capabilities_from_response(response)
             
             except asyncio.TimeoutError:
@@ -237,63 +386,34 @@ class ProtocolAnalyzer:
     def _identify_protocol_from_response(self, response: bytes) -> str:
         """Identify protocol from response data"""
         
-        response_str = response.decode('utf-8', errors='ignore').lower()
-        
-        if b'HTTP/' in response:
-            return 'HTTP'
-        elif b'SSH-' in response:
-            return 'SSH'
-        elif b'FTP' in response:
-            return 'FTP'
-        elif b'SMTP' in response:
-            return 'SMTP'
-        elif b'POP3' in response:
-            return 'POP3'
-        elif b'IMAP' in response:
-            return 'IMAP'
-        elif b'MySQL' in response:
-            return 'MySQL'
-        elif b'PostgreSQL' in response:
-            return 'PostgreSQL'
-        else:
-            return 'Unknown'
-    
-    def _extract_version_from_response(self, response: bytes) -> Optional[str]:
-        """Extract version information from response"""
+        # First matching signature wins, in priority order
+        for signature, name in _PROTOCOL_SIGNATURES:
+            if signature in response:
+                return name
         
-        response_str = response.decode('utf-8', errors='ignore')
+        return 'Unknown'
+    
+    def _extract_version_from_response(self, text: str) -> Optional[str]:
+        """Extract version information from decoded response text"""
         
         # Common version patterns
-        import re
-        version_patterns = [
-            r'HTTP/(\d+\.\d+)',
-            r'SSH-(\d+\.\d+)',
-            r'FTP server \(([^)]+)\)',
-            r'PostgreSQL/(\d+\.\d+)',
-            r'MySQL/(\d+\.\d+)'
-        ]
-        
-        for pattern in version_patterns:
-            match = re.search(pattern, response_str)
-            if match:
-                return match.group(1)
+        match = _VERSION_RE.search(text)
+        if match:
+            return next(group for group in match.groups() if group is not None)
         
         return None
     
     def _extract_capabilities_from_response(self, response: bytes) -> List[str]:
         """Extract capabilities from response"""
         
-        capabilities = []
-        response_str = response.decode('utf-8', errors='ignore').lower()
+        response_lower = response.translate(_LOWER_TABLE)
         
         # Common capability indicators
-        if 'ssl' in response_str or 'tls' in response_str:
-            capabilities.append('SSL/TLS')
-        if 'authentication' in response_str:
-            capabilities.append('Authentication')
-        if 'compression' in response_str:
-            capabilities.append('Compression')
-        if 'encryption' in response_str:
-            capabilities.append('Encryption')
-        
-        return capabilities 
\ No newline at end of file
+        if _CAPABILITY_MATCHER is not None:
+            found = _match_tags(_CAPABILITY_MATCHER, response_lower.decode('latin-1'))
+            return [capability for capability, _ in _CAPABILITY_KEYWORDS if capability in found]
+        
+        return [
+            capability for capability, keywords in _CAPABILITY_KEYWORDS
+            if any(keyword in response_lower for keyword in keywords)
+        ] 
\ No newline at end of file
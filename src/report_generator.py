@@ -5,109 +5,40 @@ Report generation for network scan results
 import json
 import csv
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 from datetime import datetime
+from operator import attrgetter
 import jinja2
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
 from .config import Config
 
-class ReportGenerator:
-    """Generate reports in various formats"""
-    
-    def __init__(self, config: Config):
-        self.config = config
-        self.output_dir = Path(config.output_directory)
-        self.output_dir.mkdir(exist_ok=True)
-    
-    def generate_report(self, results: List[Any], format_type: str):
-        """Generate report in specified format"""
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        if format_type == 'json':
-            self._generate_json_report(results, timestamp)
-        elif format_type == 'csv':
-            self._generate_csv_report(results, timestamp)
-        elif format_type == 'html':
-            self._generate_html_report(results, timestamp)
-    
-    def _generate_json_report(self, results: List[Any], timestamp: str):
-        """Generate JSON report"""
-        
-        report_data = {
-            'scan_timestamp': timestamp,
-            'total_devices': len(results),
-            'devices': [self._result_to_dict(result) for result in results]
-        }
-        
-        output_file = self.output_dir / f"network_scan_{timestamp}.json"
-        with open(output_file, 'w') as f:
-            json.dump(report_data, f, indent=2, default=str)
-    
-    def _generate_csv_report(self, results: List[Any], timestamp: str):
-        """Generate CSV report"""
-        
-        output_file = self.output_dir / f"network_scan_{timestamp}.csv"
-        
-        with open(output_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            
-            # Write header
-            writer.writerow([
-                'IP Address', 'MAC Address', 'Manufacturer', 'Device Type',
-                'Operating System', 'Open Ports', 'Protocols', 'Scan Mode'
-            ])
-            
-            # Write data
-            for result in results:
-                writer.writerow([
-                    result.ip_address,
-                    result.mac_address or '',
-                    result.manufacturer or '',
-                    result.device_type or '',
-                    result.operating_system or '',
-                    ','.join(map(str, result.open_ports)),
-                    ','.join(result.protocols),
-                    result.scan_mode
-                ])
-    
-    def _generate_html_report(self, results: List[Any], timestamp: str):
-        """Generate HTML report"""
-        
-        template = self._get_html_template()
-        
-        report_data = {
-            'timestamp': timestamp,
-            'total_devices': len(results),
-            'devices': [self._result_to_dict(result) for result in results]
-        }
-        
-        html_content = template.render(report_data)
-        
-        output_file = self.output_dir / f"network_scan_{timestamp}.html"
-        with open(output_file, 'w') as f:
-            f.write(html_content)
-    
-    def _result_to_dict(self, result: Any) -> Dict[str, Any]:
-        """Convert scan result to dictionary"""
-        
-        return {
-            'ip_address': result.ip_address,
-            'mac_address': result.mac_address,
-            'manufacturer': result.manufacturer,
-            'device_type': result.device_type,
-            'operating_system': result.operating_system,
-            'open_ports': result.open_ports,
-            'services': result.services,
-            'protocols': result.protocols,
-            'response_time': result.response_time,
-            'scan_mode': result.scan_mode
-        }
-    
-    def _get_html_template(self) -> jinja2.Template:
-        """Get HTML template for reports"""
-        
-        template_str = """
+# Scan result fields included in reports
+_REPORT_FIELDS = (
+    'ip_address', 'mac_address', 'manufacturer', 'device_type', 'operating_system',
+    'open_ports', 'services', 'protocols', 'response_time', 'scan_mode'
+)
+_get_report_fields = attrgetter(*_REPORT_FIELDS)
+_get_csv_fields = attrgetter(
+    'ip_address', 'mac_address', 'manufacturer', 'device_type', 'operating_system',
+    'open_ports', 'protocols', 'scan_mode'
+)
+
+_JSON_ENCODER = json.JSONEncoder(indent=2, default=str)
+
+def _dumps_indented(obj: Any) -> bytes:
+    """Encode obj as 2-space indented JSON, using orjson when it is installed"""
+    if _HAS_ORJSON:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return _JSON_ENCODER.encode(obj).encode('utf-8')
+
+# HTML report template
+_HTML_TEMPLATE_STR = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -374,5 +305,104 @@ class ReportGenerator:
 </body>
 </html>
         """
+
+# Compiled once and reused for every report; autoescape because device fields
+# such as banners come from the network
+_ENV = jinja2.Environment(autoescape=True, auto_reload=False)
+_HTML_TEMPLATE = _ENV.from_string(_HTML_TEMPLATE_STR)
+
+class ReportGenerator:
+    """Generate reports in various formats"""
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.output_dir = Path(config.output_directory)
+        self.output_dir.mkdir(exist_ok=True)
+    
+    def generate_report(self, results: List[Any], format_type: str):
+        """Generate report in specified format"""
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        if format_type == 'json':
+            self._generate_json_report(results, timestamp)
+        elif format_type == 'csv':
+            self._generate_csv_report(results, timestamp)
+        elif format_type == 'html':
+            self._generate_html_report(results, timestamp)
+    
+    def _generate_json_report(self, results: List[Any], timestamp: str):
+        """Generate JSON report"""
+        
+        output_file = self.output_dir / f"network_scan_{timestamp}.json"
+        
+        # Write devices one at a time instead of building the whole document in memory;
+        # the layout matches json.dump(report_data, f, indent=2, default=str)
+        with open(output_file, 'wb') as f:
+            f.write(b'{\n')
+            f.write(b'  "scan_timestamp": ' + _dumps_indented(timestamp) + b',\n')
+            f.write(b'  "total_devices": ' + _dumps_indented(len(results)) + b',\n')
+            f.write(b'  "devices": [')
+            
+            separator = b'\n'
+            for device in self._iter_devices(results):
+                f.write(separator)
+                f.write(b'    ' + _dumps_indented(device).replace(b'\n', b'\n    '))
+                separator = b',\n'
+            
+            f.write(b'\n  ]\n}' if results else b']\n}')
+    
+    def _iter_devices(self, results: List[Any]) -> Iterator[Dict[str, Any]]:
+        """Yield report dictionaries for scan results one at a time"""
+        for result in results:
+            yield self._result_to_dict(result)
+    
+    def _generate_csv_report(self, results: List[Any], timestamp: str):
+        """Generate CSV report"""
+        
+        output_file = self.output_dir / f"network_scan_{timestamp}.csv"
+        
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            
+            # Write header
+            writer.writerow([
+                'IP Address', 'MAC Address', 'Manufacturer', 'Device Type',
+                'Operating System', 'Open Ports', 'Protocols', 'Scan Mode'
+            ])
+            
+            # Write data
+            writer.writerows(self._iter_csv_rows(results))
+    
+    def _iter_csv_rows(self, results: List[Any]) -> Iterator[tuple]:
+        """Yield CSV rows for scan results one at a time"""
+        for ip, mac, manufacturer, device_type, os_name, ports, protocols, mode in map(_get_csv_fields, results):
+            yield (
+                ip, mac or '', manufacturer or '', device_type or '', os_name or '',
+                ','.join(map(str, ports)), ','.join(protocols), mode
+            )
+    
+    def _generate_html_report(self, results: List[Any], timestamp: str):
+        """Generate HTML report"""
+        
+        template = self._get_html_template()
+        
+        report_data = {
+            'timestamp': timestamp,
+            'total_devices': len(results),
+            # The template reads attributes, so scan results are passed through as-is
+            'devices': results
+        }
         
-        return jinja2.Template(template_str) 
\ No newline at end of file
+        # Stream the rendered output into the file rather than building one large string
+        output_file = self.output_dir / f"network_scan_{timestamp}.html"
+        with open(output_file, 'w') as f:
+            template.stream(report_data).dump(f)
+    
+    def _result_to_dict(self, result: Any) -> Dict[str, Any]:
+        """Convert scan result to dictionary"""
+        return dict(zip(_REPORT_FIELDS, _get_report_fields(result)))
+    
+    def _get_html_template(self) -> jinja2.Template:
+        """Get HTML template for reports"""
+        return _HTML_TEMPLATE
\ No newline at end of file
@@ -3,28 +3,221 @@ Core network scanning functionality
 """
 
 import asyncio
-import nmap
 import socket
 import subprocess
 import ipaddress
 import platform
 import sys
 import re
-from typing import Dict, List, Any, Optional
+import functools
+from typing import Callable, Dict, List, Any, Iterator, Optional, Sequence, Set, Tuple, Union
 from concurrent.futures import ThreadPoolExecutor
 import aiohttp
 import time
 import struct
+import os
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:
+    _HAS_FCNTL = False
+
+try:
+    import psutil
+    _HAS_PSUTIL = True
+except ImportError:
+    _HAS_PSUTIL = False
+
+try:
+    from pyroute2 import IPRoute
+    _HAS_PYROUTE2 = True
+except ImportError:
+    _HAS_PYROUTE2 = False
 
 from .config import Config
+from .net_utils import LoopSemaphore, get_executor, icmp_checksum, is_port_open, nmap_scan
+
+# Host platform, looked up once
+_SYSTEM = platform.system().lower()
+_IS_WINDOWS = _SYSTEM == 'windows'
+
+# nmap arguments
+_ARGS_DISCOVERY = "-sn -n"
+_ARGS_SERVICES = "-sS -sV --top-ports 1000 -T4 --max-retries 2"
+_ARGS_DEEP_SCAN = "-sS -sV -O --version-intensity 5 -p-"
+# Skip host discovery for hosts an earlier discovery scan already found up
+_ARGS_SKIP_DISCOVERY = "-Pn"
+
+# Ports checked by the basic port scan fallback, with their usual services
+_COMMON_SERVICES: Dict[int, str] = {
+    21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp', 53: 'dns',
+    80: 'http', 110: 'pop3', 143: 'imap', 443: 'https', 
+    993: 'imaps', 995: 'pop3s', 3306: 'mysql', 3389: 'rdp',
+    5432: 'postgresql', 8080: 'http-proxy', 8443: 'https-alt'
+}
+_COMMON_PORTS: Tuple[int, ...] = tuple(_COMMON_SERVICES)
+
+# "? (IP) at MAC ..." entry in BSD/Linux arp -a output; macOS drops leading zeros from octets
+_ARP_LINE = re.compile(
+    rb'\((?P<ip>(?:[0-9]{1,3}\.){3}[0-9]{1,3})\)\s+at\s+(?P<mac>(?:[0-9A-Fa-f]{1,2}[:-]){5}[0-9A-Fa-f]{1,2})'
+)
+
+# Seconds to wait for echo replies after the last request is sent
+_ICMP_TIMEOUT = 1.0
+
+def _build_echo_request(ident: int) -> bytes:
+    """Build an ICMP echo request packet with a precomputed checksum"""
+    header = struct.pack('!BBHHH', 8, 0, 0, ident, 0)
+    return struct.pack('!BBHHH', 8, 0, icmp_checksum(header), ident, 0)
+
+def _strip_ip_header(data: bytes) -> bytes:
+    """Drop the IPv4 header from a received ICMP packet, if it has one"""
+    
+    # Raw sockets, and datagram sockets on macOS, deliver the IP header; Linux
+    # datagram sockets start at the ICMP type, whose high nibble is never 4
+    if data and data[0] >> 4 == 4:
+        return data[(data[0] & 0x0F) * 4:]
+    return data
+
+# One echo request packet is sent to every host in a sweep
+_ICMP_ECHO_REQUEST = _build_echo_request(os.getpid() & 0xFFFF)
+
+# Neighbour states whose link-layer address can be trusted (NUD_REACHABLE | NUD_STALE | NUD_PERMANENT)
+_NUD_VALID = 0x02 | 0x04 | 0x80
+
+# Kernel ARP table on Linux
+_PROC_NET_ARP = '/proc/net/arp'
+
+# Linux ARP cache ioctl and the "entry complete" flag of struct arpreq
+_SIOCGARP = 0x8954
+_ATF_COM = 0x02
+_HAS_SIOCGARP = _HAS_FCNTL and _SYSTEM == 'linux'
+
+# Netlink route socket, opened on first use
+_ipr = None
+
+@functools.lru_cache(maxsize=4096)
+def _norm_mac(mac: str) -> str:
+    """Normalize a MAC address to upper-case colon-separated form"""
+    mac = mac.replace('-', ':').upper()
+    if len(mac) != 17:
+        # Zero-pad octets printed without a leading zero
+        mac = ':'.join(octet.zfill(2) for octet in mac.split(':'))
+    # Devices and ARP snapshots holding the same MAC share one string
+    return sys.intern(mac)
+
+def _host_ips(network: Union[ipaddress.IPv4Network, ipaddress.IPv6Network]) -> Iterator[str]:
+    """Yield the usable host addresses of a network as strings, like network.hosts()"""
+    
+    if network.version != 4:
+        yield from (str(ip) for ip in network.hosts())
+        return
+    
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    
+    # Networks larger than /31 exclude their network and broadcast addresses
+    if network.prefixlen < 31:
+        first += 1
+        last -= 1
+    
+    pack = struct.Struct('!I').pack
+    for address in range(first, last + 1):
+        yield socket.inet_ntoa(pack(address))
+
+def _arp_ioctl(ip: str) -> Optional[str]:
+    """Look up one IP in the Linux ARP cache with ioctl(SIOCGARP)"""
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = struct.pack('HH4s8x', socket.AF_INET, 0, socket.inet_aton(ip))
+    
+    try:
+        # The kernel only looks an entry up on a named device, so try each interface
+        for _, name in socket.if_nameindex():
+            # struct arpreq: protocol address, hardware address, flags, netmask, device
+            request = address + bytes(16) + struct.pack('i', 0) + bytes(16) + name.encode()[:15].ljust(16, b'\x00')
+            try:
+                reply = fcntl.ioctl(sock.fileno(), _SIOCGARP, request)
+            except OSError:
+                continue
+            
+            flags, = struct.unpack_from('i', reply, 32)
+            if flags & _ATF_COM:
+                return _norm_mac(reply[18:24].hex(':'))
+    finally:
+        sock.close()
+    
+    return None
+
+def _read_connection_table() -> Dict[str, List[str]]:
+    """Read this machine's inet connections as netstat-like lines, grouped by remote IP"""
+    
+    table: Dict[str, List[str]] = {}
+    
+    for conn in psutil.net_connections(kind='inet'):
+        if conn.raddr:
+            proto = 'tcp' if conn.type == socket.SOCK_STREAM else 'udp'
+            table.setdefault(conn.raddr.ip, []).append(
+                f"{proto} {conn.laddr.ip}:{conn.laddr.port} {conn.raddr.ip}:{conn.raddr.port} {conn.status}"
+            )
+    
+    return table
+
+def _get_ipr() -> 'IPRoute':
+    """Get the shared netlink route socket"""
+    global _ipr
+    if _ipr is None:
+        _ipr = IPRoute()
+    return _ipr
 
 class NetworkScanner:
     """Core network scanning functionality"""
     
     def __init__(self, config: Config):
         self.config = config
-        self.nm = nmap.PortScanner()
-        self.executor = ThreadPoolExecutor(max_workers=config.max_concurrent_scans)
+        self.executor = get_executor(config)
+        self._scan_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        
+        # This machine's connections grouped by remote IP, read once per scan
+        self._connection_table: Optional[asyncio.Future] = None
+        
+        # Limits connect sockets across every device being scanned
+        self._probe_semaphore = LoopSemaphore(config.max_concurrent_probes)
+    
+    async def aclose(self):
+        """Release this scanner's resources; the shared worker pool is shut down at exit"""
+        self.executor = None
+        self._scan_cache.clear()
+        self._connection_table = None
+    
+    async def __aenter__(self) -> 'NetworkScanner':
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def clear_scan_cache(self):
+        """Forget cached nmap results and the connection table snapshot from earlier scans"""
+        self._scan_cache.clear()
+        self._connection_table = None
+    
+    async def _cached_scan(self, hosts: str, args: str) -> Dict[str, Any]:
+        """Run an nmap scan in the worker pool and return its per-host results, reusing an earlier identical scan"""
+        
+        key = (sys.intern(hosts), args)
+        if key not in self._scan_cache:
+            # Scans take seconds to minutes, so keep them off the event loop; each
+            # pool thread uses its own PortScanner
+            loop = asyncio.get_running_loop()
+            self._scan_cache[key] = await loop.run_in_executor(self.executor, nmap_scan, hosts, args)
+        
+        return self._scan_cache[key]
+    
+    def _is_known_up(self, ip: str) -> bool:
+        """Whether a cached discovery scan already found a host up"""
+        host = self._scan_cache.get((ip, _ARGS_DISCOVERY), {}).get(ip)
+        return host is not None and host.state() == 'up'
     
     async def discover_devices(self, target: str) -> List[Dict[str, Any]]:
         """Discover devices in the target network"""
@@ -33,122 +226,44 @@ class NetworkScanner:
         
         try:
             # Use nmap for initial discovery
-            scan_args = f"-sn -n {target}"
-            self.nm.scan(hosts=target, arguments=scan_args)
+            hosts = await self._cached_scan(target, _ARGS_DISCOVERY)
             
             # Get all MAC addresses from ARP table at once
             mac_addresses = self._get_all_mac_addresses()
             
-            for host in self.nm.all_hosts():
-                if self.nm[host].state() == 'up':
-                    device_info = {
-                        'ip': host,
-                        'mac': mac_addresses.get(host),
-                        'hostname': self._get_hostname(host),
-                        'state': 'up'
-                    }
-                    devices.append(device_info)
+            up_hosts = []
+            for host, host_info in hosts.items():
+                # Later per-host scans can reuse this host's discovery result
+                self._scan_cache[(host, _ARGS_DISCOVERY)] = {host: host_info}
+                
+                if host_info.state() == 'up':
+                    up_hosts.append(host)
+            
+            # Resolve hostnames for all live hosts concurrently
+            hostnames = await asyncio.gather(*[self._get_hostname(host) for host in up_hosts])
+            
+            for host, hostname in zip(up_hosts, hostnames):
+                device_info = {
+                    'ip': host,
+                    'mac': mac_addresses.get(host),
+                    'hostname': hostname,
+                    'state': 'up'
+                }
+                devices.append(device_info)
         
         except Exception as e:
             # Fallback to ping-based discovery
-            devices = await self._ping_discovery(target)
+            devices = await self._discover_fused(target)
         
         return devices
     
-    def _get_mac_address(self, ip: str) -> Optional[str]:
-        """Get MAC address for an IP"""
-        try:
-            system = platform.system().lower()
-            
-            if system == "windows":
-                # Windows ARP command
-                result = subprocess.run(
-                    ['arp', '-a', ip], 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=5
-                )
-                
-                if result.returncode == 0:
-                    lines = result.stdout.strip().split('\n')
-                    for line in lines:
-                        if ip in line:
-                            parts = line.split()
-                            if len(parts) >= 2:
-                                mac = parts[1].replace('-', ':')
-                                if len(mac) == 17:  # Valid MAC length
-                                    return mac
-                                    
-            else:
-                # For macOS/Linux, first try to get from existing ARP table
-                try:
-                    arp_result = subprocess.run(
-                        ['arp', '-a'], 
-                        capture_output=True, 
-                        text=True, 
-                        timeout=5
-                    )
-                    
-                    if arp_result.returncode == 0:
-                        lines = arp_result.stdout.strip().split('\n')
-                        for line in lines:
-                            if ip in line:
-                                # Extract MAC address using regex
-                                mac_match = re.search(r'([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})', line)
-                                if mac_match:
-                                    return mac_match.group(0).replace('-', ':').upper()
-                except Exception:
-                    pass
-                
-                # If not found in ARP table, try to ping and then check again
-                try:
-                    # Ping the IP to populate ARP cache
-                    ping_cmd = ['ping', '-c', '1', '-W', '1', ip] if system != "windows" else ['ping', '-n', '1', '-w', '1000', ip]
-                    subprocess.run(ping_cmd, capture_output=True, timeout=3)
-                    
-                    # Now check ARP table again
-                    arp_result = subprocess.run(
-                        ['arp', '-a'], 
-                        capture_output=True, 
-                        text=True, 
-                        timeout=5
-                    )
-                    
-                    if arp_result.returncode == 0:
-                        lines = arp_result.stdout.strip().split('\n')
-                        for line in lines:
-                            if ip in line:
-                                # Extract MAC address using regex
-                                mac_match = re.search(r'([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})', line)
-                                if mac_match:
-                                    return mac_match.group(0).replace('-', ':').upper()
-                except Exception:
-                    pass
-        
-        except Exception:
-            pass
-        
-        # Fallback: Try using nmap for MAC address detection
-        try:
-            nmap_result = self.nm.scan(hosts=ip, arguments='-sn')
-            if ip in nmap_result.all_hosts():
-                host_info = nmap_result[ip]
-                if 'addresses' in host_info and 'mac' in host_info['addresses']:
-                    return host_info['addresses']['mac']
-        except Exception:
-            pass
-        
-        return None
-    
     def _get_all_mac_addresses(self) -> Dict[str, str]:
         """Get all MAC addresses from ARP table at once"""
         
         mac_addresses = {}
         
         try:
-            system = platform.system().lower()
-            
-            if system == "windows":
+            if _IS_WINDOWS:
                 # Windows ARP command
                 result = subprocess.run(
                     ['arp', '-a'], 
@@ -165,86 +280,156 @@ class NetworkScanner:
                             parts = line.split()
                             if len(parts) >= 2:
                                 ip = parts[0]
-                                mac = parts[1].replace('-', ':')
+                                mac = parts[1]
                                 if len(mac) == 17:  # Valid MAC length
-                                    mac_addresses[ip] = mac.upper()
+                                    mac_addresses[ip] = _norm_mac(mac)
                                     
             else:
-                # macOS/Linux ARP command
+                # On Linux, read the kernel neighbour table directly instead of forking arp
+                if _HAS_PYROUTE2:
+                    try:
+                        mac_addresses = self._read_netlink_neighbours()
+                    except Exception:
+                        pass
+                
+                if not mac_addresses:
+                    mac_addresses = self._read_proc_arp()
+                
+                if mac_addresses:
+                    return mac_addresses
+                
+                # macOS and other systems: parse arp output in one pass over the raw bytes
                 result = subprocess.run(
                     ['arp', '-a'], 
                     capture_output=True, 
-                    text=True, 
                     timeout=5
                 )
                 
                 if result.returncode == 0:
-                    lines = result.stdout.strip().split('\n')
-                    for line in lines:
-                        # Extract IP and MAC using regex
-                        ip_match = re.search(r'\(([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})\)', line)
-                        mac_match = re.search(r'([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})', line)
-                        
-                        if ip_match and mac_match:
-                            ip = ip_match.group(1)
-                            mac = mac_match.group(0).replace('-', ':').upper()
-                            mac_addresses[ip] = mac
+                    mac_addresses = {
+                        match['ip'].decode(): _norm_mac(match['mac'].decode())
+                        for match in _ARP_LINE.finditer(result.stdout)
+                    }
         
         except Exception:
             pass
         
         return mac_addresses
     
-    def _get_hostname(self, ip: str) -> Optional[str]:
+    def _read_netlink_neighbours(self) -> Dict[str, str]:
+        """Get IPv4 neighbours with a valid MAC address over netlink"""
+        
+        mac_addresses = {}
+        
+        for neighbour in _get_ipr().get_neighbours(family=socket.AF_INET):
+            if not neighbour['state'] & _NUD_VALID:
+                continue
+            ip = neighbour.get_attr('NDA_DST')
+            mac = neighbour.get_attr('NDA_LLADDR')
+            if ip and mac:
+                mac_addresses[ip] = _norm_mac(mac)
+        
+        return mac_addresses
+    
+    def _read_proc_arp(self) -> Dict[str, str]:
+        """Get complete entries from the kernel ARP table in /proc/net/arp"""
+        
+        mac_addresses = {}
+        
+        try:
+            with open(_PROC_NET_ARP) as f:
+                next(f, None)  # Skip header
+                for line in f:
+                    # IP address, HW type, Flags, HW address, Mask, Device
+                    parts = line.split()
+                    if len(parts) >= 4 and parts[2] != '0x0':
+                        mac_addresses[parts[0]] = _norm_mac(parts[3])
+        except OSError:
+            pass
+        
+        return mac_addresses
+    
+    async def _get_hostname(self, ip: str) -> Optional[str]:
         """Get hostname for an IP"""
         try:
-            hostname = socket.gethostbyaddr(ip)[0]
+            # NI_NAMEREQD fails instead of returning the numeric address when there is no name
+            loop = asyncio.get_running_loop()
+            hostname, _ = await loop.getnameinfo((ip, 0), socket.NI_NAMEREQD)
             return hostname
         except Exception:
             return None
     
-    async def _ping_discovery(self, target: str) -> List[Dict[str, Any]]:
-        """Fallback ping-based discovery"""
+    async def _discover_fused(self, target: str) -> List[Dict[str, Any]]:
+        """Ping-based discovery that looks up each host's MAC and hostname as soon as it replies"""
+        
+        lookups: Dict[str, asyncio.Future] = {}
+        
+        def on_alive(ip: str):
+            if ip not in lookups:
+                lookups[ip] = asyncio.ensure_future(self._lookup_host(ip))
+        
+        devices = await self._ping_discovery(target, on_alive)
+        if not lookups:
+            return devices
+        
+        results = dict(zip(lookups, await asyncio.gather(*lookups.values())))
+        
+        # Fill in MACs the per-host lookup missed from one ARP table snapshot
+        mac_addresses = {}
+        if any(mac is None for mac, _ in results.values()):
+            mac_addresses = self._get_all_mac_addresses()
+        
+        for device in devices:
+            mac, hostname = results.get(device['ip'], (None, None))
+            device['mac'] = mac or mac_addresses.get(device['ip'])
+            device['hostname'] = hostname
+        
+        return devices
+    
+    async def _lookup_host(self, ip: str) -> Tuple[Optional[str], Optional[str]]:
+        """Get the MAC address and hostname of a host that just answered a ping"""
+        
+        # The ping reply means the kernel ARP cache already has this host
+        mac = _arp_ioctl(ip) if _HAS_SIOCGARP else None
+        hostname = await self._get_hostname(ip)
+        
+        return mac, hostname
+    
+    async def _ping_discovery(self, target: str,
+                              on_alive: Optional[Callable[[str], None]] = None) -> List[Dict[str, Any]]:
+        """Fallback ping-based discovery, calling on_alive with each host as it replies"""
         
         devices = []
         network = ipaddress.ip_network(target, strict=False)
         
-        async def ping_host(ip):
+        # Sweep the whole network from one ICMP socket, then with a single fping
+        # process, before falling back to one ping process per host
+        alive = await self._icmp_sweep(network, on_alive)
+        
+        if alive is None:
             try:
-                system = platform.system().lower()
-                
-                if system == "windows":
-                    # Windows ping command
-                    proc = await asyncio.create_subprocess_exec(
-                        'ping', '-n', '1', '-w', '1000', str(ip),
-                        stdout=asyncio.subprocess.DEVNULL,
-                        stderr=asyncio.subprocess.DEVNULL
-                    )
-                else:
-                    # Linux/macOS ping command
-                    proc = await asyncio.create_subprocess_exec(
-                        'ping', '-c', '1', '-W', '1', str(ip),
-                        stdout=asyncio.subprocess.DEVNULL,
-                        stderr=asyncio.subprocess.DEVNULL
-                    )
-                
-                await proc.wait()
-                
-                if proc.returncode == 0:
-                    return {
-                        'ip': str(ip),
-                        'mac': None,
-                        'hostname': None,
-                        'state': 'up'
-                    }
-            
-            except Exception:
-                pass
-            
-            return None
+                alive = await self._fping_sweep(network, on_alive)
+            except OSError:
+                alive = None
+        
+        if alive is not None:
+            return [
+                {'ip': ip, 'mac': None, 'hostname': None, 'state': 'up'}
+                for ip in alive
+            ]
+        
+        # Cap in-flight ping processes so large networks don't exhaust file descriptors
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_probes)
+        
+        async def ping_host(ip):
+            async with semaphore:
+                device = await self._ping_host(ip)
+            if device and on_alive:
+                on_alive(ip)
+            return device
         
         # Scan network concurrently
-        tasks = [ping_host(ip) for ip in network.hosts()]
+        tasks = [ping_host(ip) for ip in _host_ips(network)]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         for result in results:
@@ -253,90 +438,218 @@ class NetworkScanner:
         
         return devices
     
-    async def scan_services(self, ip: str) -> Dict[int, str]:
-        """Scan for open ports and services"""
+    async def _ping_host(self, ip: str) -> Optional[Dict[str, Any]]:
+        """Ping one host with the system ping command"""
         
-        services = {}
+        try:
+            if _IS_WINDOWS:
+                # Windows ping command
+                proc = await asyncio.create_subprocess_exec(
+                    'ping', '-n', '1', '-w', '1000', ip,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL
+                )
+            else:
+                # Linux/macOS ping command
+                proc = await asyncio.create_subprocess_exec(
+                    'ping', '-c', '1', '-W', '1', ip,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL
+                )
+            
+            await proc.wait()
+            
+            if proc.returncode == 0:
+                return {
+                    'ip': ip,
+                    'mac': None,
+                    'hostname': None,
+                    'state': 'up'
+                }
+        
+        except Exception:
+            pass
+        
+        return None
+    
+    async def _icmp_sweep(self, network: Union[ipaddress.IPv4Network, ipaddress.IPv6Network],
+                          on_alive: Optional[Callable[[str], None]] = None) -> Optional[List[str]]:
+        """Send an echo request to every host from one ICMP socket and return the IPs that replied"""
+        
+        # The echo request and socket are ICMPv4 only
+        if network.version != 4:
+            return None
+        
+        # Unprivileged ICMP datagram sockets work on Linux and macOS; raw sockets need root
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            raw = False
+        except OSError:
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+                raw = True
+            except OSError:
+                return None
+        
+        sock.setblocking(False)
+        loop = asyncio.get_running_loop()
+        targets = list(_host_ips(network))
+        wanted = set(targets)
+        alive = set()
+        
+        def on_reply():
+            while True:
+                try:
+                    data, addr = sock.recvfrom(1024)
+                except OSError:
+                    return
+                data = _strip_ip_header(data)
+                # Raw sockets see every host's echo replies, so only count our own
+                if raw and data[4:6] != _ICMP_ECHO_REQUEST[4:6]:
+                    continue
+                if data[:1] == b'\x00' and addr[0] in wanted and addr[0] not in alive:  # Echo reply
+                    alive.add(addr[0])
+                    if on_alive:
+                        on_alive(addr[0])
         
         try:
-            # Use nmap for service detection
-            scan_args = f"-sS -sV -O --version-intensity 5 -p- {ip}"
-            self.nm.scan(hosts=ip, arguments=scan_args)
+            loop.add_reader(sock.fileno(), on_reply)
+        except NotImplementedError:
+            # Event loops without reader support (e.g. Windows proactor)
+            sock.close()
+            return None
+        
+        try:
+            for ip in targets:
+                while True:
+                    try:
+                        sock.sendto(_ICMP_ECHO_REQUEST, (ip, 0))
+                        break
+                    except BlockingIOError:
+                        # Send buffer full, let replies drain
+                        await asyncio.sleep(0.001)
+                    except OSError:
+                        # Unreachable destination
+                        break
             
-            if ip in self.nm.all_hosts():
-                for proto in self.nm[ip].all_protocols():
-                    ports = self.nm[ip][proto].keys()
-                    for port in ports:
-                        service_info = self.nm[ip][proto][port]
-                        service_name = service_info.get('name', 'unknown')
-                        services[port] = service_name
+            await asyncio.sleep(_ICMP_TIMEOUT)
+        finally:
+            loop.remove_reader(sock.fileno())
+            sock.close()
         
-        except Exception as e:
+        return [ip for ip in targets if ip in alive]
+    
+    async def _fping_sweep(self, network: ipaddress.IPv4Network,
+                           on_alive: Optional[Callable[[str], None]] = None) -> Optional[List[str]]:
+        """Ping every host in a network with one fping run and return the reachable IPs"""
+        
+        proc = await asyncio.create_subprocess_exec(
+            'fping', '-a', '-q', '-g', str(network),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        
+        # fping prints each reachable host on its own line as soon as it replies
+        alive = []
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            ip = line.decode().strip()
+            if ip:
+                alive.append(ip)
+                if on_alive:
+                    on_alive(ip)
+        await proc.wait()
+        
+        # fping exits with 1 when some hosts are unreachable; anything else is a real failure
+        if proc.returncode not in (0, 1):
+            return None
+        
+        return alive
+    
+    async def scan_services(self, ip: str) -> Dict[int, str]:
+        """Scan the most common ports for open services"""
+        
+        try:
+            host = await self._scan_host(ip, _ARGS_SERVICES)
+        except Exception:
             # Fallback to basic port scanning
-            services = await self._basic_port_scan(ip)
+            return await self._basic_port_scan(ip)
         
-        return services
+        return self._parse_services(host) if host is not None else {}
     
-    async def _basic_port_scan(self, ip: str) -> Dict[int, str]:
-        """Basic port scanning fallback"""
+    async def deep_scan(self, ip: str) -> Dict[str, Any]:
+        """Scan every port for services and fingerprint the operating system"""
         
-        services = {}
-        common_services = {
-            21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp', 53: 'dns',
-            80: 'http', 110: 'pop3', 143: 'imap', 443: 'https', 
-            993: 'imaps', 995: 'pop3s', 3306: 'mysql', 3389: 'rdp',
-            5432: 'postgresql', 8080: 'http-proxy', 8443: 'https-alt'
+        result = {
+            'services': {},
+            'os': None
         }
         
-        async def check_port(port):
-            try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(ip, port),
-                    timeout=self.config.async_timeout
-                )
-                writer.close()
-                await writer.wait_closed()
-                return port, common_services.get(port, 'unknown')
-            except Exception:
-                return None
+        try:
+            host = await self._scan_host(ip, _ARGS_DEEP_SCAN)
+        except Exception:
+            # Fallback to basic port scanning
+            result['services'] = await self._basic_port_scan(ip)
+            return result
         
-        # Check common ports concurrently
-        tasks = [check_port(port) for port in common_services.keys()]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if host is not None:
+            result['services'] = self._parse_services(host)
+            os_matches = host.get('osmatch') or []
+            if os_matches:
+                result['os'] = os_matches[0].get('name')
         
-        for result in results:
-            if result and isinstance(result, tuple):
-                port, service = result
-                services[port] = service
+        return result
+    
+    async def _scan_host(self, ip: str, args: str) -> Optional[Any]:
+        """Run an nmap scan of one host and return its result, if nmap reported it"""
+        
+        # Don't repeat host discovery for a host the discovery scan already found
+        if self._is_known_up(ip):
+            args += " " + _ARGS_SKIP_DISCOVERY
+        
+        return (await self._cached_scan(ip, args)).get(ip)
+    
+    @staticmethod
+    def _parse_services(host: Any) -> Dict[int, str]:
+        """Map open ports to service names in one host's nmap result"""
+        
+        services = {}
+        
+        for proto in host.all_protocols():
+            for port, service_info in host[proto].items():
+                services[port] = service_info.get('name', 'unknown')
         
         return services
     
-    async def quick_port_scan(self, ip: str, ports: List[int]) -> List[int]:
-        """Quick port scan for discovery mode"""
+    async def _basic_port_scan(self, ip: str) -> Dict[int, str]:
+        """Basic port scanning fallback"""
         
-        open_ports = []
+        # Check common ports concurrently
+        open_ports = await self._check_ports(ip, _COMMON_PORTS, self.config.async_timeout)
         
-        async def check_port(port):
-            try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(ip, port),
-                    timeout=2
-                )
-                writer.close()
-                await writer.wait_closed()
-                return port
-            except Exception:
-                return None
+        return {port: _COMMON_SERVICES[port] for port in open_ports}
+    
+    async def quick_port_scan(self, ip: str, ports: Sequence[int]) -> List[int]:
+        """Quick port scan for discovery mode"""
         
         # Check ports concurrently
-        tasks = [check_port(port) for port in ports]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return await self._check_ports(ip, ports, 2)
+    
+    async def _check_ports(self, ip: str, ports: Sequence[int], timeout: float) -> List[int]:
+        """Check which ports accept connections, in the order they were given"""
         
-        for result in results:
-            if result and isinstance(result, int):
-                open_ports.append(result)
+        # At most max_concurrent_probes connect sockets open across all devices
+        semaphore = self._probe_semaphore.get()
+        
+        async def check_port(port):
+            async with semaphore:
+                return await is_port_open(ip, port, timeout)
         
-        return open_ports
+        results = await asyncio.gather(*[check_port(port) for port in ports])
+        
+        return [port for port, is_open in zip(ports, results) if is_open]
     
     async def analyze_connections(self, ip: str) -> Dict[str, Any]:
         """Analyze network connections for detailed local scan"""
@@ -363,11 +676,17 @@ class NetworkScanner:
         except Exception:
             pass
         
-        # Get established connections (requires root/admin)
+        # Get established connections (requires root/admin), reading the kernel
+        # socket tables through psutil when it is available
+        if _HAS_PSUTIL:
+            try:
+                connections['established_connections'] = await self._get_connections_to(ip)
+                return connections
+            except Exception:
+                pass
+        
         try:
-            system = platform.system().lower()
-            
-            if system == "windows":
+            if _IS_WINDOWS:
                 # Windows netstat command
                 result = subprocess.run(
                     ['netstat', '-an'], 
@@ -393,4 +712,16 @@ class NetworkScanner:
         except Exception:
             pass
         
-        return connections 
\ No newline at end of file
+        return connections
+    
+    async def _get_connections_to(self, ip: str) -> List[str]:
+        """List this machine's connections with a remote IP, formatted like netstat lines"""
+        
+        # psutil walks every socket and process on the host, so take one snapshot per
+        # scan in the worker pool and share it between all devices
+        if self._connection_table is None:
+            loop = asyncio.get_running_loop()
+            self._connection_table = loop.run_in_executor(self.executor, _read_connection_table)
+        
+        table = await asyncio.shield(self._connection_table)
+        return table.get(ip, [])